@@ -1,56 +1,130 @@
 import os
+import sys
+import mmap
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
 from tkinter import filedialog
+import matplotlib
+
+# Ekran yoksa (sunucu / toplu çalıştırma) GUI'siz Agg backend; grafik PNG olarak kaydedilir
+HEADLESS = os.name == 'posix' and sys.platform != 'darwin' and not (
+    os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+if HEADLESS:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
-def count_variants(filepath):
+NL, CR, TAB, HASH = ord('\n'), ord('\r'), ord('\t'), ord('#')
+
+def _count_lines(buf):
+    """Tam satırlardan oluşan bayt dizisinde varyant satırlarını say: '#' ile başlamayan, en az
+    5 sekmeyle ayrılmış alanı olan ve REF/ALT'ı geçerli satırlar (satır satır okuyan eski
+    sürümle aynı kural; satırın son alanı olan ALT'ın uzunluğuna satır sonu da dahildir)."""
+    ends = np.flatnonzero(buf == NL)
+    terminated = np.ones(len(ends), dtype=bool)
+    if buf[-1] != NL:  # dosyanın son satırı '\n' ile bitmeyebilir
+        ends = np.append(ends, len(buf))
+        terminated = np.append(terminated, False)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    tabs = np.flatnonzero(buf == TAB)
+    k = np.searchsorted(tabs, starts)  # satırın ilk sekmesinin sırası
+    ntabs = np.searchsorted(tabs, ends) - k
+    ok = (ntabs >= 4) & (buf[np.minimum(starts, len(buf) - 1)] != HASH)
+    k, ntabs, ends, terminated = k[ok], ntabs[ok], ends[ok], terminated[ok]
+    if not len(k):
+        return 0
+    t3, t4 = tabs[k + 2], tabs[k + 3]
+    # ALT son alansa satır sonuna kadar uzanır ('\r\n' metin kipinde tek '\n' sayılır)
+    crlf = terminated & (buf[ends - 1] == CR)
+    alt_end = np.where(ntabs >= 5, tabs[np.minimum(k + 4, len(tabs) - 1)], ends - crlf + terminated)
+    ref_len, alt_len = t4 - t3 - 1, alt_end - t4 - 1
+    valid = ((ref_len == 1) & (alt_len == 1)) | (ref_len > 1) | (alt_len > 1)
+    return int(np.count_nonzero(valid))
+
+def count_variants(filepath, chunk_size=1 << 24):
+    """Varyant satırlarını say (bkz. _count_lines).
+    Satırlar Python'a tek tek okunmaz; dosya mmap ile eşlenip satır sınırında bölünen parçalar
+    halinde bayt düzeyinde taranır.
+    """
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return 0
     count = 0
-    with open(filepath, 'r') as f:
-        for line in f:
-            if line.startswith('#'):
-                continue
-            fields = line.split('\t')
-            if len(fields) >= 5:
-                ref = fields[3]
-                alt = fields[4]
-                if (len(ref) == 1 and len(alt) == 1) or (len(ref) > 1 or len(alt) > 1):
-                    count += 1
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = size
+            if start + chunk_size < size:
+                # parçayı son tam satırda bitir; satır parçadan uzunsa satır sonuna kadar uzat
+                end = mm.rfind(b'\n', start, start + chunk_size) + 1
+                if end <= start:
+                    end = mm.find(b'\n', start + chunk_size) + 1 or size
+            buf = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+            count += _count_lines(buf)
+            del buf  # mmap kapanmadan önce görünümü bırak
+            start = end
     return count
 
 def estimate_tmb(variant_count, sequenced_mb=35):
     return variant_count / sequenced_mb
 
-# 1. Klasör seçim
-root = tk.Tk()
-root.withdraw()
-selected_folder = filedialog.askdirectory(title="Kök klasörü seçin")
-
-# 2. Alt klasörlerde arama ve analiz
-results = []
-for subdir, _, files in os.walk(selected_folder):
-    for file in files:
-        if 'passing_filters' in file and file.endswith('.vcf'):
-            filepath = os.path.join(subdir, file)
-            variant_count = count_variants(filepath)
-            tmb = estimate_tmb(variant_count)
-            basename = file.split('_')[0]  # MP255 gibi örnek ismi dosya başından alıyor
-            results.append({'Sample': basename, 'TMB': tmb})
-
-# 3. Excel çıktısı (tmb_results.xlsx)
-df = pd.DataFrame(results)
-excel_path = os.path.join(selected_folder, "tmb_results.xlsx")
-df.to_excel(excel_path, index=False)
-print(f"Excel çıktı: {excel_path}")
-
-# 4. Renkli yatay barplot (long list için ideal)
-colors = ['royalblue' if r['TMB'] >= 10 else 'gray' for r in results]
-plt.figure(figsize=(7, len(results) * 0.5 + 2))  # Liste uzunluğuna göre yükseklik
-plt.barh(df['Sample'], df['TMB'], color=colors, edgecolor='black')
-plt.axvline(10, color='red', linestyle='dashed', label='Klinik TMB Sınırı (10)')
-plt.xlabel('TMB (mut/Mb)', fontsize=12)
-plt.ylabel('Vaka', fontsize=12)
-plt.title('Tümör Mutasyon Yükü (TMB) - Vakalar', fontsize=14)
-plt.legend()
-plt.tight_layout()
-plt.show()
+def iter_vcfs(root):
+    """Kök klasör ve alt klasörlerdeki 'passing_filters' VCF yollarını sırayla üretir."""
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return  # os.walk gibi okunamayan klasörleri atla
+    # os.walk sırası: önce klasördeki dosyalar, sonra alt klasörler (sembolik bağlara inilmez)
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir():
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+        elif 'passing_filters' in entry.name and entry.name.endswith('.vcf'):
+            yield entry.path
+    for path in subdirs:
+        yield from iter_vcfs(path)
+
+def count_one(filepath):
+    """Tek VCF için (örnek adı, TMB); süreç havuzunda çalışır."""
+    basename = os.path.basename(filepath).split('_')[0]  # MP255 gibi örnek ismi dosya başından alıyor
+    return basename, estimate_tmb(count_variants(filepath))
+
+if __name__ == '__main__':
+    # 1. Klasör seçim (argüman verilirse pencere açılmaz)
+    if len(sys.argv) > 1:
+        selected_folder = sys.argv[1]
+    else:
+        root = tk.Tk()
+        root.withdraw()
+        selected_folder = filedialog.askdirectory(title="Kök klasörü seçin")
+
+    # 2. Alt klasörlerde arama ve analiz (her VCF ayrı süreçte, paralel)
+    with ProcessPoolExecutor() as ex:
+        results = [{'Sample': sample, 'TMB': tmb}
+                   for sample, tmb in ex.map(count_one, iter_vcfs(selected_folder), chunksize=4)]
+
+    # 3. Excel çıktısı (tmb_results.xlsx)
+    df = pd.DataFrame(results, columns=['Sample', 'TMB'])
+    excel_path = os.path.join(selected_folder, "tmb_results.xlsx")
+    df.to_excel(excel_path, index=False)
+    print(f"Excel çıktı: {excel_path}")
+
+    # 4. Renkli yatay barplot (long list için ideal)
+    colors = np.where(df['TMB'].to_numpy() >= 10, 'royalblue', 'gray')
+    plt.figure(figsize=(7, len(df) * 0.5 + 2))  # Liste uzunluğuna göre yükseklik
+    plt.barh(df['Sample'], df['TMB'], color=colors, edgecolor='black')
+    plt.axvline(10, color='red', linestyle='dashed', label='Klinik TMB Sınırı (10)')
+    plt.xlabel('TMB (mut/Mb)', fontsize=12)
+    plt.ylabel('Vaka', fontsize=12)
+    plt.title('Tümör Mutasyon Yükü (TMB) - Vakalar', fontsize=14)
+    plt.legend()
+    plt.tight_layout()
+    if HEADLESS:
+        plot_path = os.path.join(selected_folder, "tmb_barplot.png")
+        plt.savefig(plot_path, dpi=150)
+        print(f"Grafik: {plot_path}")
+    else:
+        plt.show()
@@ -13,15 +13,33 @@ Not: VCF INFO alanında fonksiyonel anotasyon yoksa, klinik/raporlanabilir TMB'y
 Burada panel tabanlı "ham filtreli TMB" hesaplanır.
 """
 
-import os, sys, re, math, argparse, datetime, textwrap
+import os, io, sys, csv, gzip, math, argparse, datetime, textwrap
 from collections import defaultdict
-from dataclasses import dataclass, asdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 
-# Pandas opsiyonel ama Excel için gerekli
+# VCF gövdesi pandas C ayrıştırıcısıyla okunur; Excel çıktısı için de gerekli
+import numpy as np
+import pandas as pd
+
+# pyarrow opsiyonel: varsa VCF gövdesi çok iş parçacıklı Arrow CSV okuyucusuyla okunur
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+# xlsxwriter opsiyonel: varsa Excel constant_memory modunda (satır satır) yazılır, yoksa openpyxl
 try:
-    import pandas as pd
-except Exception as e:
-    pd = None
+    import xlsxwriter
+except Exception:
+    xlsxwriter = None
+
+# Numba opsiyonel: varsa STR artefakt çekirdeği JIT ile derlenir, yoksa numpy yolu kullanılır
+try:
+    from numba import njit
+except Exception:
+    njit = None
 
 # ---------- Sabit Varsayılanlar ----------
 CONFIG = {
@@ -54,16 +72,79 @@ def is_dinuc_repeat(seq: str) -> bool:
     unit = seq[:2]
     return seq == (unit * (len(seq) // 2)) + unit[:(len(seq) % 2)]
 
+if njit is not None:
+    @njit(cache=True)
+    def _repeat_allele_kernel(buf, offs, lens):
+        """Numba çekirdeği: buf[offs[i]:offs[i]+lens[i]] alleli homopolimer/di-nükleotid tekrar mı?
+        Tek iş parçacıklı: dosyalar zaten ayrı süreçlerde paralel işlenir."""
+        out = np.zeros(len(offs), dtype=np.bool_)
+        for i in range(len(offs)):
+            o, n = offs[i], lens[i]
+            if n < 3:
+                continue
+            homo, dinuc = True, n >= 4
+            for k in range(1, n):
+                b = buf[o + k]
+                homo = homo and b == buf[o]
+                dinuc = dinuc and b == buf[o + (k & 1)]
+                if not (homo or dinuc):
+                    break
+            out[i] = homo or dinuc
+        return out
+else:
+    _repeat_allele_kernel = None
+
+def _repeat_allele_mask(buf, offs, lens):
+    """buf[offs[i]:offs[i]+lens[i]] allelleri için homopolimer (AAA..., en az 3 baz) /
+    di-nükleotid tekrar (ACACAC..., en az 4 baz; tek uzunlukta ACA gibi) maskesi. Her allelin tüm baytları ilk bazıyla
+    (homopolimer) ve ilk iki bazın dönüşümlü tekrarıyla (di-nükleotid) karşılaştırılır:
+    Numba varsa derlenmiş çekirdekle, yoksa numpy üzerinde tek seferde.
+    """
+    if _repeat_allele_kernel is not None:
+        return _repeat_allele_kernel(buf, offs, lens)
+    out = np.zeros(len(lens), dtype=bool)
+    cand = lens >= 3  # homopolimer >=3, di-nükleotid >=4 baz
+    if not cand.any():
+        return out
+    offs, lens = offs[cand], lens[cand]
+    seg = np.cumsum(lens) - lens                      # her allelin seçili baytlar içindeki başı
+    starts = np.repeat(offs, lens)                    # her bayt için allelin tampondaki başı
+    k = np.arange(lens.sum()) - np.repeat(seg, lens)  # bayt allel içindeki konum
+    b = buf[starts + k]
+    homo = np.logical_and.reduceat(b == buf[starts], seg)
+    dinuc = np.logical_and.reduceat(b == buf[starts + k % 2], seg) & (lens >= 4)
+    out[cand] = homo | dinuc
+    return out
+
+def str_artifact_mask(refs, alts):
+    """Basit STR artefakt filtresi: REF ya da (virgülle ayrılmış) ALT allellerinden biri
+    homopolimer ya da di-nükleotid tekrar ise artefakt; her varyant için bool maske."""
+    n = len(refs)
+    out = np.zeros(n, dtype=bool)
+    if n == 0:
+        return out
+    refs = refs.fillna("").astype(str)
+    alts = alts.fillna("").astype(str)
+    # Tüm "REF,ALT1,ALT2,..." dizileri tek tamponda; her virgül bir allel sınırı. REF tek allel
+    # sayılır (yalnız ALT virgülden bölünür): REF içindeki virgüller ';' yapılır.
+    joined = refs.str.replace(",", ";", regex=False) + "," + alts
+    text = joined.str.cat(sep=",").upper()
+    if not text.isascii():
+        # ASCII dışı her karakter tek bayta eşlenir (128 farklı karaktere kadar farklı bayt); allel
+        # uzunlukları karakter sayısıyla aynı kalır
+        extra = sorted(c for c in set(text) if not c.isascii())
+        text = text.translate({ord(c): 128 + i % 128 for i, c in enumerate(extra)})
+    buf = np.frombuffer(text.encode("latin-1"), dtype=np.uint8)
+    sep = np.flatnonzero(buf == ord(","))
+    offs = np.concatenate(([0], sep + 1))
+    lens = np.concatenate((sep, [len(buf)])) - offs
+    owner = np.repeat(np.arange(n), joined.str.count(",").to_numpy() + 1)  # allel -> varyant satırı
+    out[owner[_repeat_allele_mask(buf, offs, lens)]] = True
+    return out
+
 def looks_like_str_artifact(ref: str, alt: str) -> bool:
-    """Basit STR artefakt filtresi: homopolimer ya da di-nükleotid tekrar içeren alleller"""
-    ref = (ref or "").upper()
-    alt = (alt or "").upper()
-    # uzun ALT listeyi virgüle göre ayırıp herhangi biri tekrar ise artefakt say
-    alts = alt.split(",") if "," in alt else [alt]
-    for allele in [ref] + alts:
-        if is_homopolymer(allele) or is_dinuc_repeat(allele):
-            return True
-    return False
+    """Tek varyant için skaler karşılık (testler için); str_artifact_mask'ı tek satırla çağırır."""
+    return bool(str_artifact_mask(pd.Series([ref or ""], dtype="str"), pd.Series([alt or ""], dtype="str"))[0])
 
 def safe_float(x, default=math.nan):
     try:
@@ -71,150 +152,274 @@ def safe_float(x, default=math.nan):
     except Exception:
         return default
 
-def parse_format(fmt: str, sample: str):
-    """FORMAT ve örnek sütunundan GT, DP ve CLCAD2'yi çıkar.
+def _to_count(s, nonneg=False):
+    """String sütunu tamsayı sayıma çevir; yalnızca tamsayı yazımları kabul edilir (int() gibi),
+    '.', '12.0', '1e2' gibi değerler NA olur. nonneg: yalnızca rakamlar (işaretsiz)."""
+    s = s.astype("str")
+    if nonneg:  # CLCAD2 derinlikleri: regex yerine isdigit (ASCII rakamlar; astype ile çevrilebilir)
+        ok = s.str.isdigit() & s.str.isascii()
+    else:
+        ok = s.str.fullmatch(r"\s*[+-]?\d+\s*")
+    ok = ok.fillna(False).astype(bool)
+    s = s.where(ok).str.strip().str.removeprefix("+")
+    s = s.where(s.str.len() <= 18)  # int64'e sığmayan sayılar NA
+    return s.astype("Int64")  # string dtype üzerinde doğrudan dönüşüm (object'e çevirmeden)
+
+def _format_fields(samples, keys, names):
+    """Aynı FORMAT'a (keys) sahip örnek değerlerinden istenen alanları object dizileri olarak çıkar.
+    Alan konumları FORMAT'tan bir kez çözülür. Alan sayısı FORMAT ile aynı olan satırlar (olağan
+    durum) tek bir str.split ile bölünür ve her alan konumuna göre dilimlenir; eksik/fazla
+    alanlı satırlar ayrıca bölünür.
+    """
+    n = len(samples)
+    out = {name: np.full(n, None, dtype=object) for name in names}
+    pos = {name: keys.index(name) for name in names if name in keys}
+    if not n or not pos:
+        return out
+    full = (samples.str.count(":") + 1 == len(keys)).to_numpy(dtype=bool, na_value=False)
+    if full.any():
+        flat = ":".join(samples[full].tolist()).split(":")
+        for name, i in pos.items():
+            out[name][full] = flat[i::len(keys)]
+    if not full.all():
+        vals = samples[~full].str.split(":", expand=True)
+        for name, i in pos.items():
+            if i < vals.shape[1]:
+                out[name][~full] = vals[i].to_numpy(dtype=object)
+    return out
+
+def parse_format_columns(fmt, samples):
+    """FORMAT ve örnek sütunlarından DP ve CLCAD2'yi çıkar; (dp, ad_alt_max, vaf) serilerini döndürür.
     CLCAD2: 'refDepth,alt1Depth,alt2Depth,...'
     DP: toplam filtreli okuma
     VAF hesaplamak için en yüksek alt derinliği seçilir.
+    FORMAT dosya boyunca çoğunlukla sabittir (Qiagen/CLC): her farklı FORMAT için DP/CLCAD2
+    konumları bir kez çözülür ve o FORMAT'lı satırlar birlikte işlenir.
     """
+    index = samples.index
+    dp_raw = np.full(len(samples), None, dtype=object)
+    ad_raw = np.full(len(samples), None, dtype=object)
+    if fmt is not None:
+        for f, rows in fmt.groupby(fmt, sort=False).indices.items():
+            fields = _format_fields(samples.iloc[rows], f.split(":") if f else [], ["DP", "CLCAD2"])
+            dp_raw[rows] = fields["DP"]
+            ad_raw[rows] = fields["CLCAD2"]
+
+    dp = _to_count(pd.Series(dp_raw, index=index))
+    # CLCAD2: boş değerler atlandıktan sonra ilk değer ref, geri kalanlar alt alleller; VAF için
+    # en yüksek alt derinliği. Tüm değerler tek split ile düz diziye açılır, satır sınırları
+    # virgül sayısından bulunur.
+    ad_max = np.full(len(index), np.nan)
+    has_ad = pd.notna(ad_raw)
+    if has_ad.any():
+        ad = pd.Series(ad_raw[has_ad], dtype="str")
+        counts = (ad.str.count(",") + 1).to_numpy(dtype=np.int64)
+        tokens = pd.Series(ad.str.cat(sep=",").split(","), dtype="str")
+        depths = _to_count(tokens, nonneg=True).to_numpy(dtype=np.float64, na_value=np.nan)
+        starts = np.cumsum(counts) - counts
+        nonempty = (tokens != "").to_numpy(dtype=bool)
+        rank = np.cumsum(nonempty)
+        rank -= np.repeat(rank[starts] - nonempty[starts], counts)  # satır içindeki sıra
+        depths[nonempty & (rank == 1)] = np.nan  # ref derinliği
+        ad_max[has_ad] = np.fmax.reduceat(depths, starts)
+    ad_alt_max = pd.Series(ad_max, index=index).astype("Int64")
+    vaf = (ad_alt_max / dp.where(dp > 0)).astype(np.float64)
+    return dp, ad_alt_max, vaf
+
+def parse_format(fmt: str, sample: str):
+    """Tek varyant için skaler karşılık (testler için): FORMAT ve örnek sütunundan GT, DP ve
+    CLCAD2'yi çıkarır; DP/ALT_AD_MAX/VAF parse_format_columns ile tek satır üzerinden hesaplanır."""
     result = {"GT": None, "DP": None, "CLCAD2": None, "ALT_AD_MAX": None, "VAF": None}
-    try:
-        keys = fmt.split(":") if fmt else []
-        vals = sample.split(":") if sample else []
-        m = dict(zip(keys, vals))
-        gt = m.get("GT")
-        dp = m.get("DP")
-        ad = m.get("CLCAD2")
-        result["GT"] = gt
-        result["DP"] = int(dp) if dp is not None and dp != "." else None
-        result["CLCAD2"] = ad
-        if ad and ad != ".":
-            parts = [p for p in ad.split(",") if p != ""]
-            # parts[0] ref, geri kalan alt alleller
-            if len(parts) >= 2:
-                alt_depths = [int(x) for x in parts[1:] if re.fullmatch(r"\d+", x)]
-                if alt_depths:
-                    alt_max = max(alt_depths)
-                    result["ALT_AD_MAX"] = alt_max
-                    if result["DP"] and result["DP"] > 0:
-                        result["VAF"] = alt_max / result["DP"]
-        return result
-    except Exception:
-        return result
-
-@dataclass
-class VarRow:
-    sample: str
-    chrom: str
-    pos: int
-    ref: str
-    alt: str
-    qual: float
-    filt: str
-    dp: int
-    ad_alt_max: int
-    vaf: float
-    kept: bool
-    reason: str
+    m = dict(zip(fmt.split(":") if fmt else [], sample.split(":") if sample else []))
+    result["GT"] = m.get("GT")
+    dp, ad_alt_max, vaf = parse_format_columns(pd.Series([fmt], dtype="str"), pd.Series([sample or ""], dtype="str"))
+    result["DP"] = None if pd.isna(dp[0]) else int(dp[0])
+    if result["DP"] is None and m.get("DP") not in (None, "."):
+        return result  # eski sürümde geçersiz DP'de ayrıştırma burada kesilirdi
+    result["CLCAD2"] = m.get("CLCAD2")
+    result["ALT_AD_MAX"] = None if pd.isna(ad_alt_max[0]) else int(ad_alt_max[0])
+    result["VAF"] = None if pd.isna(vaf[0]) else float(vaf[0])
+    return result
 
 # ---------- VCF Okuyucu ----------
 
+READ_BUFFER = 1 << 20  # 1 MiB okuma tamponu (varsayılan 8 KiB yerine; daha az sistem çağrısı)
+
+def _open_vcf(vcf_path: str):
+    """VCF'yi ikili modda, geniş okuma tamponuyla aç; .gz (bgzip dahil) dosyalar akış halinde
+    açılır, önceden tamamen açılmaz."""
+    if vcf_path.endswith(".gz"):
+        return io.BufferedReader(gzip.open(vcf_path, "rb"), buffer_size=READ_BUFFER)
+    return open(vcf_path, "rb", buffering=READ_BUFFER)
+
+def _field_counts(body):
+    """Her satırdaki alan sayısı (sekme sayısı + 1); son satırın '\\n' ile bitmesi gerekmez."""
+    buf = np.frombuffer(body, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord("\n"))
+    if len(buf) and buf[-1] != ord("\n"):
+        ends = np.append(ends, len(buf))
+    tabs = np.searchsorted(np.flatnonzero(buf == ord("\t")), ends)  # satır sonuna kadarki sekmeler
+    return np.diff(tabs, prepend=0) + 1
+
+def _read_vcf_body(f, header_cols, usecols):
+    """Başlıktan sonraki veri satırlarını tek seferde oku (tüm alanlar string; sayısal dönüşüm
+    sütun bazında yapılır). Kullanılan sütunlara ulaşmayan kısa satırlar atlanır.
+    pyarrow varsa Arrow CSV okuyucusu kullanılır. Arrow alan sayısı başlıktan farklı satırları
+    tutamaz: böyle bir satır (örn. sondaki fazladan sekme) ya da geçersiz UTF-8 varsa dosya
+    pandas C ayrıştırıcısıyla baştan okunur.
+    """
+    if pa is not None:
+        body_start = f.tell()
+        names = [header_cols[i] for i in usecols]
+        need = max(usecols) + 1
+
+        def on_invalid(row):
+            return "skip" if row.actual_columns < need else "error"
+
+        try:
+            table = pa_csv.read_csv(
+                f,
+                read_options=pa_csv.ReadOptions(column_names=header_cols),
+                parse_options=pa_csv.ParseOptions(delimiter="\t", quote_char=False,
+                                                  invalid_row_handler=on_invalid),
+                convert_options=pa_csv.ConvertOptions(include_columns=names,
+                                                      column_types={c: pa.string() for c in names}),
+            )
+            return table.to_pandas()
+        except pa.ArrowInvalid:
+            f.seek(body_start)
+
+    # pandas eksik alanları boş string ile doldurur; kısa satırlar bu yüzden sekme sayısından
+    # bulunur. Satırlar dosyadaki satırlarla birebir eşleşsin diye boş satırlar da okunur.
+    body = f.read()
+    counts = _field_counts(body)
+    if not len(counts) or counts.max() <= max(usecols):
+        # hiçbir satır kullanılan sütunlara ulaşmıyor (boş ya da yalnız kısa satırlar); read_csv
+        # bu durumda usecols yüzünden hata verir
+        return pd.DataFrame({header_cols[i]: pd.Series(dtype="str") for i in sorted(usecols)})
+    df = pd.read_csv(
+        io.BytesIO(body), sep="\t", header=None, names=header_cols, usecols=usecols,
+        dtype=str, na_filter=False, quoting=csv.QUOTE_NONE, comment=None,
+        index_col=False, skip_blank_lines=False, lineterminator="\n", engine="c",
+        encoding="utf-8", encoding_errors="ignore",
+    )
+    if b"\r" in body:  # CRLF satır sonları
+        for c in df.columns:
+            df[c] = df[c].str.removesuffix("\r")
+    return df[counts > max(usecols)].reset_index(drop=True)
+
+def _read_vcf_header(f):
+    """#CHROM satırına kadar ilerle; (başlık sütunları, örnek adı ya da None) döndürür.
+    Dosya tanıtıcısı gövdenin ilk satırında kalır."""
+    for raw in iter(f.readline, b""):
+        line = raw.decode("utf-8", errors="ignore")
+        if line.startswith("##"):
+            continue
+        if line.startswith("#CHROM"):
+            header_cols = line.strip().lstrip("#").split("\t")
+            # beklenen minimum sütunlar
+            required = ["CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER"]
+            if not all(c in header_cols for c in required):
+                raise ValueError("Beklenen VCF sütunları bulunamadı (#CHROM .. QUAL .. FILTER).")
+            # FORMAT ve örnek isimleri varsa tespit et
+            sample_name = None
+            if "FORMAT" in header_cols and len(header_cols) > header_cols.index("FORMAT") + 1:
+                sample_name = header_cols[-1]
+            return header_cols, sample_name
+    raise ValueError("VCF başlığı (#CHROM ...) bulunamadı.")
+
+def vcf_sample_name(vcf_path: str):
+    """Yalnız başlığı okuyarak read_vcf_variants'ın vereceği örnek adını döndür."""
+    with _open_vcf(vcf_path) as f:
+        _, sample_name = _read_vcf_header(f)
+    return sample_name or os.path.basename(vcf_path)
+
 def read_vcf_variants(vcf_path: str):
-    """VCF'den varyantları (satırları) üretir. Header'ı çöz, sample sütununu bul."""
+    """VCF'den varyant tablosunu (DataFrame) üretir. Header'ı çöz, sample sütununu bul.
+    Veri satırları satır satır Python'da değil, _read_vcf_body ile tek seferde okunur (pyarrow
+    varsa Arrow CSV okuyucusu, yoksa pandas C ayrıştırıcısı).
+    """
     if not os.path.exists(vcf_path):
         raise FileNotFoundError(vcf_path)
 
-    with open(vcf_path, "r", encoding="utf-8", errors="ignore") as f:
-        header_cols = None
-        sample_name = None
-        for line in f:
-            if line.startswith("##"):
-                continue
-            if line.startswith("#CHROM"):
-                header_cols = line.strip().lstrip("#").split("\t")
-                # beklenen minimum sütunlar
-                required = ["CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER"]
-                if not all(c in header_cols for c in required):
-                    raise ValueError("Beklenen VCF sütunları bulunamadı (#CHROM .. QUAL .. FILTER).")
-                # FORMAT ve örnek isimleri varsa tespit et
-                if "FORMAT" in header_cols and len(header_cols) > header_cols.index("FORMAT") + 1:
-                    sample_name = header_cols[-1]
-                break
-
-        if header_cols is None:
-            raise ValueError("VCF başlığı (#CHROM ...) bulunamadı.")
-
-    # Tekrar aç ve veri satırlarını işle
-    variants = []
-    with open(vcf_path, "r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            if not line or line.startswith("#"):
-                continue
-            parts = line.rstrip("\n").split("\t")
-            # kolon indexleri
-            try:
-                idx = {name: i for i, name in enumerate(header_cols)}
-                chrom = parts[idx["CHROM"]]
-                pos = int(parts[idx["POS"]])
-                ref = parts[idx["REF"]]
-                alt = parts[idx["ALT"]]
-                qual = safe_float(parts[idx["QUAL"]])
-                filt = parts[idx["FILTER"]] if "FILTER" in idx else "."
-                fmt = parts[idx["FORMAT"]] if "FORMAT" in idx else None
-                sample_col = parts[idx[sample_name]] if sample_name else None
-            except Exception:
-                # hatalı satırları atla
-                continue
+    # Tek açılış: başlığa kadar satır satır ilerle, gövdeyi aynı dosya tanıtıcısından oku
+    with _open_vcf(vcf_path) as f:
+        header_cols, sample_name = _read_vcf_header(f)
 
-            parsed = parse_format(fmt, sample_col) if sample_name else {"DP": None, "ALT_AD_MAX": None, "VAF": None, "GT": None}
-            dp = parsed.get("DP")
-            ad_alt_max = parsed.get("ALT_AD_MAX")
-            vaf = parsed.get("VAF")
+        # Sütun konumları başlıktan bir kez hesaplanır; ID/INFO gibi kullanılmayan (çoğu zaman
+        # en geniş) alanlar hiç ayrıştırılmaz
+        cols = ["CHROM", "POS", "REF", "ALT", "QUAL", "FILTER"] + (["FORMAT"] if "FORMAT" in header_cols else [])
+        usecols = [header_cols.index(c) for c in cols] + ([len(header_cols) - 1] if sample_name else [])
 
-            # Çoklu ALT'ları string olarak koru (detay sayfasında görünür)
-            variants.append({
-                "sample": sample_name or os.path.basename(vcf_path),
-                "chrom": chrom, "pos": pos, "ref": ref, "alt": alt,
-                "qual": qual, "filt": filt,
-                "dp": dp, "ad_alt_max": ad_alt_max, "vaf": vaf
-            })
+        df = _read_vcf_body(f, header_cols, usecols)
 
-    return sample_name or os.path.basename(vcf_path), variants
+    # hatalı satırları atla: tamsayı olmayan POS, başlıktan sonra gelen '#' satırları (eksik
+    # sütunlu satırlar okurken atlanır). Boş alanlar eksik değer olarak filtrelemeye kalır.
+    ok = df["POS"].str.fullmatch(r"\s*[+-]?\d+\s*") & ~df["CHROM"].str.startswith("#")
+    df = df[ok].reset_index(drop=True)
+    pos = pd.to_numeric(df["POS"].str.strip()).astype(np.int64)
+
+    if sample_name:
+        dp, ad_alt_max, vaf = parse_format_columns(df["FORMAT"] if "FORMAT" in df else None, df[sample_name])
+    else:
+        dp = ad_alt_max = pd.Series(pd.NA, index=df.index, dtype="Int64")
+        vaf = pd.Series(np.nan, index=df.index)
+
+    # Sütun bazlı (SoA) tablo: az sayıda farklı değer alan alanlar kategorik, POS 32-bit.
+    # Çoklu ALT'ları string olarak koru (detay sayfasında görünür)
+    sample = sample_name or os.path.basename(vcf_path)
+    variants = pd.DataFrame({
+        "sample": pd.Categorical([sample] * len(df)),
+        "chrom": df["CHROM"].astype("category"),
+        "pos": pos.astype(np.int32 if pos.max() < 2**31 else np.int64),
+        "ref": df["REF"], "alt": df["ALT"],
+        "qual": pd.to_numeric(df["QUAL"], errors="coerce").astype(np.float64),
+        "filter": df["FILTER"].astype("category"),
+        "dp": dp, "ad_alt_max": ad_alt_max, "vaf": vaf,
+    })
+
+    return sample, variants
 
 # ---------- Filtreleme ve TMB ----------
 
+def _as_mask(cond):
+    """Karşılaştırma sonucunu (NA'lar False) numpy bool dizisine çevir."""
+    if isinstance(cond, pd.Series):
+        return cond.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(cond, dtype=bool)
+
+def filter_variants(variants, cfg):
+    """Varyantı rapor TMB hesabına dahil etme kriterleri, tüm tablo üzerinde vektörel.
+    (kept maskesi, eleme nedeni dizisi) döndürür; her varyant için aşağıdaki sıradaki ilk
+    sağlanmayan kriter neden olarak yazılır.
+    """
+    qual, dp, ad, vaf = variants["qual"], variants["dp"], variants["ad_alt_max"], variants["vaf"]
+    conds, reasons = [], []
+    if cfg["require_pass"]:
+        conds.append(~variants["filter"].isin([".", "PASS"]))
+        reasons.append("FILTER!=PASS")
+    conds += [qual.isna(), dp.isna(), ad.isna(), vaf.isna(),
+              qual < cfg["qual_min"], dp < cfg["dp_min"], ad < cfg["alt_min"], vaf < cfg["vaf_min"]]
+    reasons += ["QUAL_missing", "DP_missing", "AD_alt_missing", "VAF_missing",
+                f"QUAL<{cfg['qual_min']}", f"DP<{cfg['dp_min']}", f"ALT<{cfg['alt_min']}", f"VAF<{cfg['vaf_min']}"]
+    if cfg["drop_str_artifacts"]:
+        conds.append(str_artifact_mask(variants["ref"], variants["alt"]))
+        reasons.append("STR_artifact")
+
+    reason = np.select([_as_mask(c) for c in conds], reasons, default="OK")
+    return reason == "OK", reason
+
 def keep_variant(v, cfg):
-    """Varyantı rapor TMB hesabına dahil etme kriterleri."""
-    reasons = []
-    # FILTER PASS
-    if cfg["require_pass"] and v["filt"] not in (".", "PASS"):
-        return False, "FILTER!=PASS"
-
-    # Temel alanlar mevcut mu?
-    if v["qual"] is None or math.isnan(v["qual"]):
-        return False, "QUAL_missing"
-    if v["dp"] is None:
-        return False, "DP_missing"
-    if v["ad_alt_max"] is None:
-        return False, "AD_alt_missing"
-    if v["vaf"] is None:
-        return False, "VAF_missing"
-
-    # Eşikler
-    if v["qual"] < cfg["qual_min"]:
-        return False, f"QUAL<{cfg['qual_min']}"
-    if v["dp"] < cfg["dp_min"]:
-        return False, f"DP<{cfg['dp_min']}"
-    if v["ad_alt_max"] < cfg["alt_min"]:
-        return False, f"ALT<{cfg['alt_min']}"
-    if v["vaf"] < cfg["vaf_min"]:
-        return False, f"VAF<{cfg['vaf_min']}"
-
-    # STR artefakt
-    if cfg["drop_str_artifacts"] and looks_like_str_artifact(v["ref"], v["alt"]):
-        return False, "STR_artifact"
-
-    return True, "OK"
+    """Tek varyant için skaler karşılık (testler için): v sözlüğünü tek satırlık tabloya çevirip
+    filter_variants ile süzer; (kept, neden) döndürür."""
+    row = pd.DataFrame({
+        "filter": pd.Series([v["filter"]], dtype="str"),
+        "ref": pd.Series([v["ref"] or ""], dtype="str"),
+        "alt": pd.Series([v["alt"] or ""], dtype="str"),
+        **{c: pd.Series([v[c]], dtype="Float64") for c in ("qual", "dp", "ad_alt_max", "vaf")},
+    })
+    keep, reason = filter_variants(row, cfg)
+    return bool(keep[0]), str(reason[0])
 
 def compute_tmb(kept_count: int, panel_mb: float):
     if panel_mb and panel_mb > 0:
@@ -223,9 +428,10 @@ def compute_tmb(kept_count: int, panel_mb: float):
 
 # ---------- Raporlama ----------
 
-def make_text_report(sample_name, kept, dropped, outdir, cfg, vcf_path):
-    """Hasta bazlı TXT rapor"""
-    tmb = compute_tmb(len(kept), cfg["panel_mb"])
+def make_text_report(sample_name, kept_df, dropped_df, outdir, cfg, vcf_path, report_name=None):
+    """Hasta bazlı TXT rapor (kept_df / dropped_df: process_vcf'in varyant tabloları).
+    report_name verilmezse dosya adı '{sample}_TMB_report.txt' olur."""
+    tmb = compute_tmb(len(kept_df), cfg["panel_mb"])
     today = datetime.date.today().isoformat()
 
     lines = []
@@ -239,7 +445,7 @@ def make_text_report(sample_name, kept, dropped, outdir, cfg, vcf_path):
     lines.append(f"Filter PASS şartı: {'Evet' if cfg['require_pass'] else 'Hayır'}")
     lines.append(f"STR artefakt elemesi: {'Evet' if cfg['drop_str_artifacts'] else 'Hayır'}")
     lines.append("")
-    lines.append(f"Nitelikli varyant sayısı: {len(kept)}")
+    lines.append(f"Nitelikli varyant sayısı: {len(kept_df)}")
     lines.append(f"TMB (varyant/Mb): {tmb:.2f}" if not math.isnan(tmb) else "TMB: hesaplanamadı (panel_mb eksik)")
     lines.append("")
     lines.append("Notlar:")
@@ -250,54 +456,166 @@ def make_text_report(sample_name, kept, dropped, outdir, cfg, vcf_path):
 
     # İlk 20 varyant
     lines.append("İlk 20 nitelikli varyant (CHROM:POS REF>ALT | QUAL | DP | ALT_AD_MAX | VAF):")
-    for r in kept[:20]:
-        vaf_str = f"{r['vaf']:.3f}" if r.get("vaf") is not None and not math.isnan(r["vaf"]) else ""
-        lines.append(f"{r['chrom']}:{r['pos']} {r['ref']}>{r['alt']} | {r['qual']:.2f} | {r['dp']} | {r['ad_alt_max']} | {vaf_str}")
+    for r in kept_df.head(20).itertuples(index=False):
+        vaf_str = f"{r.vaf:.3f}" if not pd.isna(r.vaf) else ""
+        lines.append(f"{r.chrom}:{r.pos} {r.ref}>{r.alt} | {r.qual:.2f} | {r.dp} | {r.ad_alt_max} | {vaf_str}")
 
-    report_path = os.path.join(outdir, f"{sample_name}_TMB_report.txt")
+    report_path = os.path.join(outdir, report_name or f"{sample_name}_TMB_report.txt")
     with open(report_path, "w", encoding="utf-8") as w:
         w.write("\n".join(lines))
     return report_path, tmb
 
-def write_excel(all_rows, summary_rows, outdir):
-    if pd is None:
-        return None
-    df_all = pd.DataFrame(all_rows)
-    df_sum = pd.DataFrame(summary_rows)
+EXCEL_MAX_ROWS = 1048576  # xlsx sayfa sınırı (başlık satırı dahil)
+
+class VariantWriter:
+    """Dosya dosya gelen varyant tablolarını tek bir dosyaya ekleyerek yazar; tüm dosyaların
+    satırları bellekte birikmez. pyarrow varsa Parquet (tmb_variants.parquet), yoksa CSV."""
+
+    # Sütun türleri sabittir; şema ilk dosyanın tür çıkarımına (kategorikler, POS genişliği,
+    # tümü tamsayı görünen QUAL) bağlı kalmaz
+    SCHEMA = [("sample", "string"), ("chrom", "string"), ("pos", "int64"), ("ref", "string"),
+              ("alt", "string"), ("qual", "float64"), ("filter", "string"), ("dp", "int64"),
+              ("ad_alt_max", "int64"), ("vaf", "float64"), ("kept", "bool_"), ("reason", "string")]
+
+    def __init__(self, outdir):
+        self.path = os.path.join(outdir, "tmb_variants.parquet" if pa is not None else "tmb_variants.csv")
+        self.rows = 0
+        self._writer = None
+        self._schema = pa.schema([(c, getattr(pa, t)()) for c, t in self.SCHEMA]) if pa is not None else None
+        if os.path.exists(self.path):
+            os.remove(self.path)  # önceki çalıştırmanın çıktısına eklenmesin
+
+    def write(self, df):
+        if not len(df):
+            return
+        if pa is not None:
+            table = pa.Table.from_pandas(df.astype({c: str for c in ("sample", "chrom", "filter")}),
+                                         schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="a", header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def iter_chunks(self, chunk_size=65536):
+        """Yazılan tabloyu parça parça (DataFrame) geri oku."""
+        if not self.rows:
+            return
+        if pa is not None:
+            for batch in pq.ParquetFile(self.path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(self.path, chunksize=chunk_size, keep_default_na=False, na_values=[""])
+
+def _sheet_rows(chunks):
+    """DataFrame parçalarından başlık ve satırları (NA -> None, Python değerleri) sırayla üret."""
+    header = True
+    for df in chunks:
+        if header:
+            yield list(df.columns)
+            header = False
+        df = df.astype(object)
+        yield from df.where(df.notna(), None).itertuples(index=False, name=None)
+
+def _write_xlsx(xlsx_path, sheets):
+    """Sayfaları satır satır akıtarak yaz: xlsxwriter varsa constant_memory modunda,
+    yoksa openpyxl write_only modunda (tüm çalışma kitabı bellekte tutulmaz)."""
+    if xlsxwriter is not None:
+        wb = xlsxwriter.Workbook(xlsx_path, {"constant_memory": True, "nan_inf_to_errors": True,
+                                             "strings_to_formulas": False, "strings_to_urls": False})
+        try:
+            bold = wb.add_format({"bold": True})
+            for name, chunks in sheets:
+                ws = wb.add_worksheet(name)
+                for r, row in enumerate(_sheet_rows(chunks)):
+                    ws.write_row(r, 0, row, bold if r == 0 else None)
+        finally:
+            wb.close()
+        return
+
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for name, chunks in sheets:
+        ws = wb.create_sheet(name)
+        for row in _sheet_rows(chunks):
+            ws.append(row)
+    wb.save(xlsx_path)
+
+def write_excel(summary_rows, outdir, variants=None):
+    """summary + variants sayfalı Excel'i yaz. variants sayfası VariantWriter dosyasından parça
+    parça akıtılır; Excel satır sınırını aşarsa yalnız summary yazılır (varyantlar o dosyada kalır).
+    """
     xlsx_path = os.path.join(outdir, "tmb_summary_and_variants.xlsx")
-    with pd.ExcelWriter(xlsx_path, engine="openpyxl") as xw:
-        df_sum.to_excel(xw, index=False, sheet_name="summary")
-        df_all.to_excel(xw, index=False, sheet_name="variants")
+    sheets = [("summary", [pd.DataFrame(summary_rows)])]
+    if variants is not None and variants.rows < EXCEL_MAX_ROWS:
+        sheets.append(("variants", variants.iter_chunks()))
+    _write_xlsx(xlsx_path, sheets)
     return xlsx_path
 
 # ---------- Çalıştırıcı ----------
 
-def process_vcf(vcf_path: str, outdir: str, cfg: dict):
+def process_vcf(vcf_path: str, outdir: str, cfg: dict, report_name=None):
     sample, variants = read_vcf_variants(vcf_path)
-    kept_rows, drop_rows = [], []
-    for v in variants:
-        keep, reason = keep_variant(v, cfg)
-        row = {
-            "sample": v["sample"],
-            "chrom": v["chrom"],
-            "pos": v["pos"],
-            "ref": v["ref"],
-            "alt": v["alt"],
-            "qual": v["qual"],
-            "filter": v["filt"],
-            "dp": v["dp"],
-            "ad_alt_max": v["ad_alt_max"],
-            "vaf": v["vaf"],
-            "kept": keep,
-            "reason": reason
-        }
-        if keep:
-            kept_rows.append(row)
-        else:
-            drop_rows.append(row)
-    txt_path, tmb = make_text_report(sample, kept_rows, drop_rows, outdir, cfg, vcf_path)
+    keep, reason = filter_variants(variants, cfg)
+    variants["kept"] = keep
+    variants["reason"] = reason
+    kept_rows = variants[keep].reset_index(drop=True)
+    drop_rows = variants[~keep].reset_index(drop=True)
+    txt_path, tmb = make_text_report(sample, kept_rows, drop_rows, outdir, cfg, vcf_path, report_name)
     return sample, kept_rows, drop_rows, txt_path, tmb
 
+def report_names(vcf_paths):
+    """Girişlerin TXT rapor adları, giriş sırasına göre belirlenir. Aynı örnek adı birden çok
+    dosyada geçerse ilki '{sample}_TMB_report.txt', sonrakiler '{sample}_2_TMB_report.txt',
+    '{sample}_3_TMB_report.txt', ... olur; paralel işlemede raporlar birbirinin üzerine yazılmaz."""
+    names, seen = [], defaultdict(int)
+    for vcf_path in vcf_paths:
+        try:
+            sample = vcf_sample_name(vcf_path)
+        except Exception:
+            names.append(None)  # dosya işlenirken aynı hata summary'ye yazılır
+            continue
+        seen[sample] += 1
+        suffix = f"_{seen[sample]}" if seen[sample] > 1 else ""
+        names.append(f"{sample}{suffix}_TMB_report.txt")
+    return names
+
+def _process_all(vcf_paths, outdir, cfg, names):
+    """(giriş sırası, Future) çiftlerini dosyalar bittikçe üretir. Tek dosya süreç havuzu
+    kurulmadan (süreç başlatma ve tabloların pickle maliyeti olmadan) bu süreçte işlenir.
+    Çağıran, sonuçları giriş sırasıyla yazar: giriş sırasında henüz yazılamayan (biten ya da
+    işlenen) dosya sayısı işçi sayısını aşmaz, yeni dosya ancak sıranın başı ilerleyince
+    gönderilir. Böylece yavaş bir dosyanın arkasında biriken tablolar da sınırlı kalır."""
+    if len(vcf_paths) == 1:
+        fut = Future()
+        try:
+            fut.set_result(process_vcf(vcf_paths[0], outdir, cfg, names[0]))
+        except Exception as e:
+            fut.set_exception(e)
+        yield 0, fut
+        return
+    workers = min(len(vcf_paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures, finished, next_submit, next_done = {}, set(), 0, 0
+        while next_done < len(vcf_paths):
+            while next_submit < min(len(vcf_paths), next_done + workers):
+                fut = ex.submit(process_vcf, vcf_paths[next_submit], outdir, cfg, names[next_submit])
+                futures[fut] = next_submit
+                next_submit += 1
+            for fut in wait(futures, return_when=FIRST_COMPLETED).done:
+                i = futures.pop(fut)
+                finished.add(i)
+                yield i, fut
+            while next_done in finished:  # çağıranın giriş sırasıyla yazabildiği baş kısım
+                finished.remove(next_done)
+                next_done += 1
+
 def parse_args(argv):
     p = argparse.ArgumentParser(description="Basit TMB raporlayıcı (Qiagen/CLC VCF). Varsayılanlarla çalışır.")
     p.add_argument("--vcf", nargs="+", help="Bir veya daha fazla VCF dosyası yolu")
@@ -350,45 +668,62 @@ def main(argv=None):
 
     os.makedirs(args.outdir, exist_ok=True)
 
-    all_rows = []
-    summary_rows = []
-    txt_paths = []
-    for vcf_path in args.vcf or []:
-        try:
-            sample, kept, dropped, txt_path, tmb_val = process_vcf(vcf_path, args.outdir, cfg)
-            txt_paths.append(txt_path)
-            all_rows.extend(kept + dropped)
-            summary_rows.append({
-                "sample": sample,
-                "vcf": vcf_path,
-                "panel_name": cfg["panel_name"],
-                "reference": cfg["reference"],
-                "panel_mb": cfg["panel_mb"],
-                "kept_variants": len(kept),
-                "dropped_variants": len(dropped),
-                "tmb_variants_per_mb": round(tmb_val, 3) if not math.isnan(tmb_val) else None,
-                "qual_min": cfg["qual_min"],
-                "dp_min": cfg["dp_min"],
-                "alt_min": cfg["alt_min"],
-                "vaf_min": cfg["vaf_min"],
-                "require_pass": cfg["require_pass"],
-                "drop_str_artifacts": cfg["drop_str_artifacts"]
-            })
-        except Exception as e:
-            # Hatalı dosyayı summary'ye not düş
-            summary_rows.append({
-                "sample": os.path.basename(vcf_path),
-                "vcf": vcf_path,
-                "panel_name": cfg["panel_name"],
-                "reference": cfg["reference"],
-                "panel_mb": cfg["panel_mb"],
-                "kept_variants": None,
-                "dropped_variants": None,
-                "tmb_variants_per_mb": None,
-                "error": str(e)
-            })
-
-    xlsx_path = write_excel(all_rows, summary_rows, args.outdir) if (pd is not None) else None
+    # Her VCF bağımsız: birden çok dosya ayrı süreçlerde paralel işlenir (bkz. _process_all).
+    # Biten dosyaların varyantları giriş sırasıyla hemen diske akıtılır; bellekte summary
+    # satırları ve en fazla işçi sayısı kadar dosyanın tabloları tutulur.
+    vcf_paths = list(args.vcf or [])
+    done = [None] * len(vcf_paths)
+    variants = VariantWriter(args.outdir)
+    try:
+        if vcf_paths:
+            pending, next_i = {}, 0
+            for i, fut in _process_all(vcf_paths, args.outdir, cfg, report_names(vcf_paths)):
+                vcf_path = vcf_paths[i]
+                try:
+                    sample, kept, dropped, txt_path, tmb_val = fut.result()
+                    done[i] = ({
+                        "sample": sample,
+                        "vcf": vcf_path,
+                        "panel_name": cfg["panel_name"],
+                        "reference": cfg["reference"],
+                        "panel_mb": cfg["panel_mb"],
+                        "kept_variants": len(kept),
+                        "dropped_variants": len(dropped),
+                        "tmb_variants_per_mb": round(tmb_val, 3) if not math.isnan(tmb_val) else None,
+                        "qual_min": cfg["qual_min"],
+                        "dp_min": cfg["dp_min"],
+                        "alt_min": cfg["alt_min"],
+                        "vaf_min": cfg["vaf_min"],
+                        "require_pass": cfg["require_pass"],
+                        "drop_str_artifacts": cfg["drop_str_artifacts"]
+                    }, txt_path)
+                    pending[i] = [kept, dropped]
+                except Exception as e:
+                    # Hatalı dosyayı summary'ye not düş
+                    done[i] = ({
+                        "sample": os.path.basename(vcf_path),
+                        "vcf": vcf_path,
+                        "panel_name": cfg["panel_name"],
+                        "reference": cfg["reference"],
+                        "panel_mb": cfg["panel_mb"],
+                        "kept_variants": None,
+                        "dropped_variants": None,
+                        "tmb_variants_per_mb": None,
+                        "error": str(e)
+                    }, None)
+                    pending[i] = []
+                while next_i in pending:
+                    for frame in pending.pop(next_i):
+                        variants.write(frame)
+                    next_i += 1
+    finally:
+        variants.close()
+
+    summary_rows = [summary for summary, _ in done]
+    txt_paths = [txt_path for _, txt_path in done if txt_path]
+
+    xlsx_path = write_excel(summary_rows, args.outdir, variants)
+    variants_path = variants.path if variants.rows else None
 
     # Konsol özeti
     print("Tamamlandı.")
@@ -397,6 +732,8 @@ def main(argv=None):
             print("TXT:", pth)
     if xlsx_path:
         print("Excel:", xlsx_path)
+    if variants_path:
+        print("Varyantlar:", variants_path)
 
     return 0
 